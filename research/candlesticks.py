@@ -1,7 +1,8 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
 
 
 def candlesticks(df, title='', upColor='blue', downColor='red'):
@@ -21,35 +22,34 @@ def candlesticks(df, title='', upColor='blue', downColor='red'):
     ax.grid(True)
     ax.margins(0)
 
-    for row in df.itertuples():
-        if row.close >= row.open:
-            color = upColor
-            bodyHi, bodyLo = row.close, row.open
-        else:
-            color = downColor
-            bodyHi, bodyLo = row.open, row.close
-        line = Line2D(
-            xdata=(row.Index, row.Index),
-            ydata=(row.low, bodyLo),
-            color=color,
-            linewidth=1)
-        ax.add_line(line)
-        line = Line2D(
-            xdata=(row.Index, row.Index),
-            ydata=(row.high, bodyHi),
-            color=color,
-            linewidth=1)
-        ax.add_line(line)
-        rect = Rectangle(
-            xy=(row.Index - 0.3, bodyLo),
-            width=0.6,
-            height=bodyHi - bodyLo,
-            edgecolor=color,
-            facecolor=color,
-            alpha=0.4,
-            antialiased=True
-        )
-        ax.add_patch(rect)
+    # wicks and bodies for all bars as two collections
+    x = df.index.to_numpy()
+    up = (df['close'] >= df['open']).to_numpy()
+    colors = np.where(up[:, None], to_rgba(upColor), to_rgba(downColor))
+    body_hi = np.where(up, df['close'], df['open'])
+    body_lo = np.where(up, df['open'], df['close'])
+    low = df['low'].to_numpy()
+    high = df['high'].to_numpy()
+
+    lower_wicks = np.stack([np.column_stack([x, low]),
+                            np.column_stack([x, body_lo])], axis=1)
+    upper_wicks = np.stack([np.column_stack([x, high]),
+                            np.column_stack([x, body_hi])], axis=1)
+    ax.add_collection(LineCollection(
+        np.concatenate([lower_wicks, upper_wicks]),
+        colors=np.tile(colors, (2, 1)),
+        linewidths=1))
+
+    bodies = np.stack([np.column_stack([x - 0.3, body_lo]),
+                       np.column_stack([x + 0.3, body_lo]),
+                       np.column_stack([x + 0.3, body_hi]),
+                       np.column_stack([x - 0.3, body_hi])], axis=1)
+    ax.add_collection(PolyCollection(
+        bodies,
+        edgecolors=colors,
+        facecolors=colors,
+        alpha=0.4,
+        antialiased=True))
 
     ax.autoscale_view()
     plt.show()
@@ -1,3 +1,5 @@
+from functools import cached_property
+
 import pandas as pd
 import numpy as np
 
@@ -7,6 +9,8 @@ class VolumeGrouper:
     Resample given df based on volume.
 
     After initializing the object, resampled df is available as df property.
+    It's computed on first access and the same df is returned afterwards,
+    so changes made to it in place are seen by later accesses.
     """
 
     volume = 0
@@ -87,7 +91,7 @@ class VolumeGrouper:
         daily_volume = daily_volume.dropna()
         return daily_volume['rolling_volume']
 
-    @property
+    @cached_property
     def df(self) -> pd.DataFrame:
         """Format output. Returned df indexed by date."""
         vol_candles = self.in_df.copy().reset_index()
@@ -123,10 +127,10 @@ def group_by_volume(df, volume=1000, dynamic=False, multiple=30, days=10):
 
 
 def group_by_time(df, time_int):
-    vol_candles = pd.DataFrame()
-    vol_candles['open'] = df.open.resample(time_int).first()
-    vol_candles['high'] = df.high.resample(time_int).max()
-    vol_candles['low'] = df.low.resample(time_int).min()
-    vol_candles['close'] = df.close.resample(time_int).last()
+    vol_candles = df[['open', 'high', 'low', 'close']].resample(time_int).agg(
+        {'open': 'first',
+         'high': 'max',
+         'low': 'min',
+         'close': 'last', })
     vol_candles = vol_candles.reset_index()
     return vol_candles
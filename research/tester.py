@@ -1,6 +1,7 @@
 from datetime import timedelta
-from functools import partial
+from functools import lru_cache, partial
 from typing import Callable, List, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
 
 from grouper import group_by_volume, VolumeGrouper
@@ -29,7 +30,8 @@ vol_dict = {'NQ': 10000, 'ES': 33000, 'GC': 5500, 'CL': 11500}
 min_dict = {'NQ': 30, 'ES': 120, 'GC': 30, 'CL': 30}
 
 
-def get_data(contract, start_date=START_DATE, end_date=END_DATE):
+@lru_cache(maxsize=len(symbol_dict))
+def _read_store(contract, start_date, end_date):
     return store.read(symbol_dict[contract]
                       ).sort_index().loc[start_date: end_date]
 
@@ -38,6 +40,24 @@ def get_data(contract, start_date=START_DATE, end_date=END_DATE):
     # ).loc[start_date:end_date]
 
 
+def get_data(contract, start_date=START_DATE, end_date=END_DATE):
+    """
+    Read price data from store.  Store reads are cached, so repeated runs
+    (calibrate_multiple, run, simulate) for the same contract and dates
+    hit the store only once; every call returns its own copy.
+
+    The cache keeps one full minute-bar df per contract/date range
+    (up to one per symbol) alive for the whole session, and each call
+    holds an extra copy on top of that.  Use clear_data_cache() to free
+    the memory or to pick up store updates.
+    """
+    return _read_store(contract, start_date, end_date).copy()
+
+
+def clear_data_cache() -> None:
+    _read_store.cache_clear()
+
+
 def get_fixed_vol(symbol: str) -> float:
     return vol_dict[symbol]
 
@@ -69,8 +89,13 @@ def calibrate(inds: pd.DataFrame, adjustment: Optional[float] = None,
     else:
         adjustments = 10/inds.abs().mean()
     scaled_inds = (inds * adjustments).clip(lower=-20, upper=20)
-    target_vol = scaled_inds.abs().std().mean()
-    corr = scaled_inds.corr()
+    # convert to contiguous array once, all stats below are computed on it
+    values = np.ascontiguousarray(scaled_inds.to_numpy(dtype=np.float64))
+    target_vol = np.nanmean(np.nanstd(np.abs(values), axis=0, ddof=1))
+    # correlations over rows without missing values
+    complete = values[~np.isnan(values).any(axis=1)]
+    corr = pd.DataFrame(np.atleast_2d(np.corrcoef(complete, rowvar=False)),
+                        index=scaled_inds.columns, columns=scaled_inds.columns)
 
     # negative correlations capped at zero
     corr_non_negative = corr.copy()
@@ -78,10 +103,10 @@ def calibrate(inds: pd.DataFrame, adjustment: Optional[float] = None,
 
     reverse_sum_corr = 1 / corr_non_negative.mean()
     weights = reverse_sum_corr / reverse_sum_corr.sum()
-    scaled_inds_combined = (scaled_inds * weights).sum(axis=1)
+    scaled_inds_combined = np.nansum(values * weights.to_numpy(), axis=1)
 
     if multiplier is None:
-        multiplier = target_vol / scaled_inds_combined.abs().std()
+        multiplier = target_vol / np.std(np.abs(scaled_inds_combined), ddof=1)
 
     return weights, adjustments, multiplier, corr
 
@@ -2,11 +2,12 @@ from multiprocessing import Pool, cpu_count
 import sys
 sys.path.append('/home/tomek/ib_tools')  # noqa
 from collections import namedtuple
-from typing import NamedTuple, List, Union, Optional, Dict
+from typing import NamedTuple, List, Union, Optional, Dict, Tuple
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from numba import jit
 
 from pyfolio.timeseries import perf_stats
 
@@ -154,36 +155,57 @@ def pos(price: pd.Series,
     return Results(positions, opens, closes, transactions)
 
 
+@jit(nopython=True)
+def _compound_pnl(pnl: np.array, position: np.array, bankroll: float
+                  ) -> Tuple[np.array, np.array, np.array]:
+    """
+    Numba optimized implementation of compound_pnl.  Should not be used
+    directly, but via compound_pnl, which accepts pandas objects.
+
+    Returns:
+        Tuple of arrays: size, comp_pnl_dollars, balance.
+    """
+    size = np.zeros(pnl.shape[0])
+    comp = np.zeros(pnl.shape[0])
+    balance = np.full(pnl.shape[0], bankroll)
+    for i in range(1, pnl.shape[0]):
+        if position[i-1] != position[i] and position[i] != 0:
+            size[i] = round(balance[i-1] / bankroll)
+        if size[i] == 0:
+            if ((position[i-1] == position[i] and position[i] != 0)
+                    or pnl[i] != 0):
+                size[i] = size[i-1]
+        comp[i] = size[i] * pnl[i]
+        balance[i] = balance[i-1] + comp[i]
+    return size, comp, balance
+
+
 def compound_pnl(df,  bankroll):
     """
     Given df with 'position' and 'pnl_dollars' determine when position size
     would be multiplied based on account balance. Position size aims to keep
     to stay in similar proportion to balance as it was initially to bankroll.
+
+    Positions may be int or float (pandas loop used before numba
+    raised TypeError for float positions).
+
+    >>> idx = pd.date_range('2020-01-02', periods=5, freq='min', name='date')
+    >>> df = pd.DataFrame({'pnl_dollars': [0, 10, 15000, -5, 30],
+    ...                    'position': [0, 1, 1, -1, -1]}, index=idx)
+    >>> c = compound_pnl(df, 15000)
+    >>> c['size'].tolist()
+    [0, 1, 1, 2, 2]
+    >>> c['balance'].tolist()
+    [15000.0, 15010.0, 30010.0, 30000.0, 30060.0]
     """
     df = df.copy()
-    df['comp_pnl_dollars'] = 0
-    df['size'] = 0
-    df['balance'] = bankroll
-    df.reset_index(inplace=True)
-
-    for i in df.index:
-        if i == df.index[0]:
-            continue
-        df.loc[i, 'size'] = (
-            df.loc[i-1, 'position'] != df.loc[i, 'position']
-            & df.loc[i, 'position'] != 0) * round(
-            df.loc[i-1, 'balance']/bankroll)
-
-        if df.loc[i, 'size'] == 0:
-            df.loc[i, 'size'] = df.loc[i-1, 'size'] * (
-                ((df.loc[i-1, 'position'] == df.loc[i, 'position']) &
-                 (df.loc[i, 'position'] != 0))
-                | (df.loc[i, 'pnl_dollars'] != 0))
-
-        df.loc[i, 'comp_pnl_dollars'] = df.loc[
-            i, 'size'] * df.loc[i, 'pnl_dollars']
-        df.loc[i, 'balance'] = df.loc[:i, 'comp_pnl_dollars'].sum() + bankroll
-    df.set_index('date', inplace=True)
+    size, comp, balance = _compound_pnl(
+        df['pnl_dollars'].to_numpy(dtype=np.float64),
+        df['position'].to_numpy(dtype=np.float64),
+        float(bankroll))
+    df['comp_pnl_dollars'] = comp
+    df['size'] = size.astype('int')
+    df['balance'] = balance
     return df
 
 
@@ -207,7 +229,8 @@ def perf(df: pd.DataFrame,
          output: bool = True,
          compound: bool = False,
          price_column_name: str = 'price',
-         slippage: float = 0) -> NamedTuple:
+         slippage: float = 0,
+         min_tick: Optional[float] = None) -> NamedTuple:
     """
     Extract performance indicators from simulation done by other functions.
 
@@ -224,6 +247,9 @@ def perf(df: pd.DataFrame,
                     capital simulation
         price_column_name: which column in df contains price data
         slippage:   transaction cost expressed as multiple of min-tick
+        min_tick:   min-tick used to price slippage, estimated from price
+                    data if not given (pass it when running many
+                    simulations on the same price series)
 
     Returns:
         Named tuple of resulting DataFrames for inspection:
@@ -238,28 +264,76 @@ def perf(df: pd.DataFrame,
         df.rename(columns={price_column_name: 'price'}, inplace=True)
 
     if slippage:
-        cost = get_min_tick(df.price) * slippage
+        cost = (min_tick if min_tick is not None
+                else get_min_tick(df.price)) * slippage
     else:
         cost = 0
 
-    df['transaction'] = (df['position'] - df['position'].shift(1)
-                         .fillna(0)).astype('int')
-
-    df['slippage'] = df['transaction'].abs() * cost
-    if (df.position[-1] != 0):  # & (df.transaction[-1] == 0):
-        df.slippage[-1] += np.abs(df.position[-1]) * cost
+    columns = _pnl_columns(df['price'].to_numpy(dtype=np.float64),
+                           df['position'].to_numpy(dtype=np.float64)[:, None],
+                           cost)
+    for name, values in columns.items():
+        df[name] = values[:, 0]
+    return _perf_from_pnl(df, cost, multiplier, bankroll, output, compound)
 
-    df['curr_price'] = (df['position'] - df['transaction']) * df['price']
 
-    df['base_price'] = (df['price'].shift(
-        1) * df['position'].shift(1)).fillna(0)
-    df['pnl'] = df['curr_price'] - df['base_price'] - df['slippage']
+def _pnl_columns(price: np.ndarray, position: np.ndarray, cost: float
+                 ) -> Dict[str, np.ndarray]:
+    """
+    Per bar pnl calculation of perf for many position columns at once.
 
-    slip_return = np.log((-df['slippage'] / df['price']) + 1).fillna(0)
-    price_return = np.log(((df['curr_price'] - df['base_price'])
-                           / abs(df['base_price'])) + 1).fillna(0)
-    df['lreturn'] = slip_return + price_return
+    Args:
+        price:    1-D array of transaction prices
+        position: 2-D array, one row for every price, one column for
+                  every simulation
+        cost:     transaction cost per contract in price points
 
+    Returns:
+        Dict of 2-D arrays (same shape as position) with perf columns:
+        'transaction', 'slippage', 'curr_price', 'base_price', 'pnl',
+        'lreturn'.
+    """
+    price = price[:, None]
+    prev_position = np.zeros_like(position, dtype=np.float64)
+    prev_position[1:] = position[:-1]
+    transaction = (position - prev_position).astype('int')
+
+    slippage = np.abs(transaction) * cost
+    # close out open position at the end
+    slippage[-1] += np.abs(position[-1]) * cost
+
+    curr_price = (position - transaction) * price
+
+    base_price = np.zeros_like(curr_price)
+    base_price[1:] = price[:-1] * position[:-1]
+    base_price[np.isnan(base_price)] = 0
+    pnl = curr_price - base_price - slippage
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slip_return = np.log((-slippage / price) + 1)
+        price_return = np.log(((curr_price - base_price)
+                               / np.abs(base_price)) + 1)
+    slip_return[np.isnan(slip_return)] = 0
+    price_return[np.isnan(price_return)] = 0
+
+    return {'transaction': transaction,
+            'slippage': slippage,
+            'curr_price': curr_price,
+            'base_price': base_price,
+            'pnl': pnl,
+            'lreturn': slip_return + price_return}
+
+
+def _perf_from_pnl(df: pd.DataFrame,
+                   cost: float,
+                   multiplier: int = 0,
+                   bankroll: float = 15000,
+                   output: bool = True,
+                   compound: bool = False) -> NamedTuple:
+    """
+    Daily returns, position matching and stats part of perf.  df must
+    already have columns created by _pnl_columns.
+    """
     # get daily returns
     if multiplier:
         df['pnl_dollars'] = df['pnl'] * multiplier
@@ -333,7 +407,8 @@ def perf(df: pd.DataFrame,
 def perf_var(df: pd.DataFrame,
              output: bool = True,
              price_column_name: str = 'price',
-             slippage: int = 0):
+             slippage: int = 0,
+             min_tick: Optional[float] = None):
     """
     Shortcut interface function for perf to generate variable capital
     simulation.
@@ -344,11 +419,13 @@ def perf_var(df: pd.DataFrame,
                     is extracted from those two columns
         output:     whether output is to be printed out
         price_column_name: which column in df contains price data
+        min_tick:   min-tick used to price slippage, estimated from price
+                    data if not given
 
     """
 
     return perf(df, output=output, price_column_name=price_column_name,
-                slippage=slippage)
+                slippage=slippage, min_tick=min_tick)
 
 
 def v_backtester(price: pd.Series,
@@ -377,12 +454,30 @@ def v_backtester(price: pd.Series,
 
     df = pd.DataFrame({'price': price,
                        'indicator': indicator})
-    df['signal'] = ((df['indicator'] > threshold) * 1) \
-        + ((df['indicator'] < -threshold) * -1)
-    df['position'] = (df['signal'].shift(1).fillna(0)).astype('int')
+    signal, position = v_backtester_grid(df['indicator'], [threshold])
+    df['signal'] = signal[:, 0]
+    df['position'] = position[:, 0]
     return df
 
 
+def v_backtester_grid(indicator: pd.Series, thresholds: List[float]
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Signal and position rule of v_backtester for many thresholds at once.
+
+    Returns:
+        Tuple of arrays (signal, position), each with one row for every
+        indicator value and one column for every threshold.
+    """
+    ind = indicator.to_numpy(dtype=np.float64)[:, None]
+    th = np.asarray(thresholds, dtype=np.float64)[None, :]
+    # values are -1, 0, 1 only
+    signal = (ind > th).astype('int8') - (ind < -th)
+    position = np.zeros_like(signal)
+    position[1:] = signal[:-1]
+    return signal, position
+
+
 def c_backtester(data: pd.DataFrame,
                  sl_atr: float = 50,
                  trailing_sl: bool = True,
@@ -557,16 +652,15 @@ def true_sharpe(ret):
     (defined by different caluclation conventions).
     """
     r = pd.Series()
-    df = pd.DataFrame({'returns': ret})
-    df['cummulative_return'] = (df['returns'] + 1).cumprod()
-    df['log_returns'] = np.log(df['returns']+1)
-    r['cummulative_return'] = df['cummulative_return'][-1] - 1
+    returns = np.asarray(ret, dtype=np.float64)
+    log_returns = np.log1p(returns)
+    r['cummulative_return'] = np.nanprod(returns + 1) - 1
     r['annual_return'] = ((r['cummulative_return'] + 1)
-                          ** (252 / len(df.index))) - 1
-    r['mean'] = df['returns'].mean() * 252
-    r['mean_log'] = df['log_returns'].mean() * 252
-    r['vol'] = df['returns'].std() * np.sqrt(252)
-    r['vol_log'] = df['log_returns'].std() * np.sqrt(252)
+                          ** (252 / len(returns))) - 1
+    r['mean'] = np.nanmean(returns) * 252
+    r['mean_log'] = np.nanmean(log_returns) * 252
+    r['vol'] = np.nanstd(returns, ddof=1) * np.sqrt(252)
+    r['vol_log'] = np.nanstd(log_returns, ddof=1) * np.sqrt(252)
     r['sharpe'] = r['mean'] / r['vol']
     r['sharpe_log'] = r['mean_log'] / r['vol_log']
     return r
@@ -719,14 +813,53 @@ out = NamedTuple('Out', [('stats', pd.DataFrame),
                          ('dailys', pd.DataFrame),
                          ('returns', pd.DataFrame),
                          ('positions', Dict[float, pd.DataFrame]),
-                         ('dfs', pd.DataFrame),
+                         ('dfs', Optional[Dict[float, pd.DataFrame]]),
                          ])
 
 
+# data shared by all backtests of a summary run, set once per worker process
+_sweep = {}
+
+
+def _init_sweep(price: pd.Series, indicator: pd.Series,
+                grid: Dict[str, np.ndarray], cost: float,
+                keep_full: bool) -> None:
+    _sweep.update(price=price, indicator=indicator, grid=grid, cost=cost,
+                  keep_full=keep_full)
+
+
+def _summary_one(price: pd.Series, indicator: pd.Series,
+                 columns: Dict[str, np.ndarray], cost: float,
+                 keep_full: bool, threshold: float) -> Optional[Tuple]:
+    """
+    Run backtest for one threshold given its signal, position and pnl
+    columns.  Return plain tuple (results of perf cannot be pickled) or
+    None if backtest generated no valid positions.  Source df is
+    returned only if keep_full.
+    """
+    b = pd.DataFrame({'price': price,
+                      'indicator': indicator,
+                      **columns}, index=price.index)
+    try:
+        r = _perf_from_pnl(b, cost, output=False)
+    except ZeroDivisionError:
+        return None
+    return (threshold, r.stats, r.daily, r.positions,
+            r.df if keep_full else None)
+
+
+def _summary_worker(j: int, threshold: float) -> Optional[Tuple]:
+    columns = {name: values[:, j] for name, values in _sweep['grid'].items()}
+    return _summary_one(_sweep['price'], _sweep['indicator'], columns,
+                        _sweep['cost'], _sweep['keep_full'], threshold)
+
+
 def summary(price: Union[pd.Series, pd.DataFrame],
             indicator: Optional[pd.Series] = None,
             slip: float = 0,
-            threshold: Optional[Union[List, float]] = None) -> out:
+            threshold: Optional[Union[List, float]] = None,
+            n_jobs: int = 1,
+            keep_full: bool = False) -> out:
     """
     Return stats summary of strategy for various thresholds
     run on the indicator. The strategy is long when indicator > threshold
@@ -734,8 +867,22 @@ def summary(price: Union[pd.Series, pd.DataFrame],
 
     Trades are executed on the given price. Price and indicator
     must have the same index.
+
+    n_jobs is the number of processes to run backtests in; 1 runs
+    them sequentially in current process, -1 uses all available cores,
+    other positive integers give number of processes (no other values
+    are accepted).
+
+    Full backtest dfs (one copy of the data for every threshold) are
+    returned only if keep_full is True, otherwise dfs is None; a single
+    one can be recreated with:
+    perf_var(v_backtester(price, indicator, threshold), False, slippage=slip)
     """
 
+    if not (isinstance(n_jobs, int) and (n_jobs >= 1 or n_jobs == -1)):
+        raise ValueError(f'Invalid n_jobs: {n_jobs}. '
+                         f'Must be -1 or a positive integer')
+
     if isinstance(price, pd.DataFrame) and indicator is None:
         indicator = price.forecast
         price = price.open
@@ -745,20 +892,47 @@ def summary(price: Union[pd.Series, pd.DataFrame],
     elif isinstance(threshold, (int, float)):
         threshold = [threshold]
 
-    stats = pd.DataFrame()
-    dailys = pd.DataFrame()
-    returns = pd.DataFrame()
+    # signals and per bar pnl for all thresholds computed in one pass,
+    # only position matching and stats are done for every threshold
+    signal, position = v_backtester_grid(indicator, threshold)
+    cost = get_min_tick(price) * slip if slip else 0
+    grid = {'signal': signal,
+            'position': position,
+            **_pnl_columns(price.to_numpy(dtype=np.float64), position, cost)}
+
+    if n_jobs == 1:
+        results = [_summary_one(price, indicator,
+                                {name: values[:, j]
+                                 for name, values in grid.items()},
+                                cost, keep_full, i)
+                   for j, i in enumerate(threshold)]
+    else:
+        processes = cpu_count() if n_jobs == -1 else n_jobs
+        with Pool(processes=processes, initializer=_init_sweep,
+                  initargs=(price, indicator, grid, cost, keep_full)
+                  ) as pool:
+            results = pool.starmap(_summary_worker, enumerate(threshold))
+
+    # collect results in dicts and build every DataFrame once
+    stats = {}
+    daily = {}
     positions = {}
-    dfs = {}
-    for i in threshold:
-        try:
-            b = v_backtester(price, indicator, i)
-            r = perf_var(b, False, slippage=slip)
-        except ZeroDivisionError:
+    dfs = {} if keep_full else None
+    for result in results:
+        if result is None:
             continue
-        stats[i] = r.stats
-        dailys[i] = r.daily.balance
-        returns[i] = r.daily['returns']
-        positions[i] = r.positions
-        dfs[i] = r.df
-    return out(stats, dailys, returns, positions, dfs)
+        i, r_stats, r_daily, r_positions, r_df = result
+        stats[i] = r_stats
+        daily[i] = r_daily[['balance', 'returns']]
+        positions[i] = r_positions
+        if dfs is not None:
+            dfs[i] = r_df
+
+    if daily:
+        combined = pd.concat(daily, axis=1)
+        dailys = combined.xs('balance', axis=1, level=1)
+        returns = combined.xs('returns', axis=1, level=1)
+    else:
+        dailys = pd.DataFrame()
+        returns = pd.DataFrame()
+    return out(pd.DataFrame(stats), dailys, returns, positions, dfs)